@@ -4,9 +4,21 @@ DataMatrix Parser for GS1 formatted pharmaceutical barcodes.
 Based on proven parsing logic that handles concatenated format without group separators.
 """
 
+import functools
+import re
 import sys
 import json
-from datetime import datetime
+from collections import namedtuple
+from typing import Optional
+
+# Serialize results with orjson's C encoder when it is installed
+try:
+    import orjson
+    
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj).decode('utf-8')
+except ImportError:
+    _dumps = json.dumps
 
 # GS1 Application Identifiers and their expected lengths 
 # None means variable-length
@@ -18,6 +30,150 @@ GS1_AIS = {
 }
 
 GROUP_SEPARATOR = '\x1d'  # ASCII 29
+GROUP_SEPARATOR_BYTE = GROUP_SEPARATOR.encode('ascii')
+
+# Cached parse results are immutable; callers get a dict copy
+ParsedDataMatrix = namedtuple(
+    'ParsedDataMatrix',
+    ['gtin', 'serial_number', 'lot_number', 'expiration_date', 'ndc']
+)
+
+# Lot AI packed as a 16-bit int of its two ASCII bytes, so the serial scan can
+# test for it without building a 2-char substring
+AI_LOT = 0x3130  # '10'
+
+# Candidate expiration AI inside a serial: "17" followed by exactly 6 digits.
+# The lookahead keeps the digits unconsumed so finditer sees every "17".
+EXP_AI_PATTERN = re.compile(rb'17(?=[0-9]{6})')
+
+# Preformatted date parts indexed by 2-digit value.
+# YY -> YYYY follows 00-49 -> 2000-2049, 50-99 -> 1950-1999.
+_YEAR_STR = [f"{(2000 + yy if yy < 50 else 1900 + yy):04d}" for yy in range(100)]
+_DD_STR = [f"{v:02d}" for v in range(100)]
+
+
+def _valid_exp(b: bytes) -> bool:
+    """
+    Basic YYMMDD sanity check: 1 <= MM <= 12 and 1 <= DD <= 31.
+    
+    Trusts the caller to pass 6 ASCII digits (EXP_AI_PATTERN guarantees this).
+    """
+    mm = (b[2] - 0x30) * 10 + (b[3] - 0x30)
+    dd = (b[4] - 0x30) * 10 + (b[5] - 0x30)
+    return 1 <= mm <= 12 and 1 <= dd <= 31
+
+
+# Each setter stores one AI's field and returns the cursor past it, or None
+# when that AI isn't expected at this position (the scan then moves on by one).
+# Checking what has already been found prevents finding "01" within serial
+# numbers, etc.
+
+def _set_gtin(result: dict, buf: bytes, pos: int, field_end: int, n: int) -> Optional[int]:
+    """GTIN (01) - must be at start."""
+    if result['gtin'] or field_end > n:
+        return None
+    gtin_bytes = buf[pos+2:field_end]
+    result['gtin'] = gtin_bytes.decode('ascii')
+    
+    # Extract NDC from GTIN
+    if gtin_bytes[:3] == b'003':
+        # For GTIN starting with 003, extract NDC from positions 4-12 (9 digits)
+        # Expected format: 14395-7010
+        result['ndc'] = (gtin_bytes[3:8] + b'-' + gtin_bytes[8:12]).decode('ascii')
+    return field_end
+
+
+def _set_serial(result: dict, buf: bytes, pos: int, field_end: int, n: int,
+                find_exp_ais=EXP_AI_PATTERN.finditer) -> Optional[int]:
+    """
+    Serial (21) - variable length.
+    
+    find_exp_ais is bound once at definition time so the scan uses a local
+    rather than a global plus attribute lookup; callers never pass it.
+    """
+    if not result['gtin'] or result['serial_number']:
+        return None
+    start = pos + 2
+    
+    # For serial numbers, we need to be smarter about finding the end
+    # Serial numbers can contain "17" or "10" as digits, so we can't just
+    # search for these patterns. Instead, we'll look for a pattern where
+    # we definitely have the next AI based on expected data after it.
+    
+    end = n  # default to end
+    
+    # Let the regex engine jump straight to each "17" + 6 digits
+    # candidate instead of stepping through the serial byte by byte.
+    # A bare "10" is not used as a terminator - finding "17" + valid
+    # date + "10" is far more reliable.
+    for match in find_exp_ais(buf, start):
+        j = match.start()
+        potential_exp = buf[j+2:j+8]
+        
+        # Check what comes after these 6 digits
+        after_exp_pos = j + 8
+        
+        # If we're at the end, this is likely the expiration AI
+        if after_exp_pos >= n:
+            end = j
+            break
+        
+        # If followed by AI 10 (lot), this is likely the expiration AI
+        if after_exp_pos + 2 <= n and ((buf[after_exp_pos] << 8) | buf[after_exp_pos+1]) == AI_LOT:
+            end = j
+            break
+            
+        # If the expiration date forms a valid date, more likely to be the AI
+        # rather than random digits in serial
+        if _valid_exp(potential_exp):
+            end = j
+            break
+            
+    result['serial_number'] = buf[start:end].decode('ascii')
+    return end
+
+
+def _set_exp(result: dict, buf: bytes, pos: int, field_end: int, n: int) -> Optional[int]:
+    """Expiration (17) - fixed 6 digits."""
+    if not result['gtin'] or result['expiration_date'] or field_end > n:
+        return None
+    exp_date = buf[pos+2:field_end]
+    # bytes.isdigit() only accepts ASCII '0'..'9', so the digits can be read
+    # straight off the bytes
+    if exp_date.isdigit():
+        yy = (exp_date[0] - 0x30) * 10 + (exp_date[1] - 0x30)
+        mm = (exp_date[2] - 0x30) * 10 + (exp_date[3] - 0x30)
+        dd = (exp_date[4] - 0x30) * 10 + (exp_date[5] - 0x30)
+        
+        result['expiration_date'] = f"{_YEAR_STR[yy]}-{_DD_STR[mm]}-{_DD_STR[dd]}"
+    return field_end
+
+
+def _set_lot(result: dict, buf: bytes, pos: int, field_end: int, n: int) -> Optional[int]:
+    """Lot (10) - variable length, usually at end."""
+    if not result['gtin'] or result['lot_number']:
+        return None
+    # Everything after AI is the lot number
+    result['lot_number'] = buf[pos+2:].decode('ascii')
+    return n
+
+
+AI_SETTER = {
+    '01': _set_gtin,
+    '10': _set_lot,
+    '17': _set_exp,
+    '21': _set_serial,
+}
+
+# Two-level trie over AI digits: AI_TRIE[d0][d1] is (setter, field length) for
+# a known AI, None otherwise. Probing it is two list indexes per position.
+# Every GS1_AIS entry needs a setter, so a missing one fails here at import
+# rather than on the first barcode that contains it.
+AI_TRIE = [[None] * 10 for _ in range(10)]
+for _ai, _length in GS1_AIS.items():
+    AI_TRIE[int(_ai[0])][int(_ai[1])] = (AI_SETTER[_ai], _length)
+del _ai, _length
+
 
 def parse_gs1_datamatrix(raw_data: str):
     """
@@ -30,14 +186,36 @@ def parse_gs1_datamatrix(raw_data: str):
       17 260930          (Expiration) 
       10 2405224         (Lot)
     
+    Repeated scans of the same barcode are served from an LRU cache; each call
+    still returns a fresh dict the caller is free to modify.
+    
     Args:
-        raw_data: Raw DataMatrix content
+        raw_data: Raw DataMatrix content (ASCII)
         
     Returns:
         dict with parsed gtin, serial_number, lot_number, expiration_date, ndc
+        
+    Raises:
+        ValueError: if raw_data contains non-ASCII characters
     """
+    return _parse_cached(raw_data)._asdict()
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_cached(raw_data: str) -> ParsedDataMatrix:
+    """Parse raw DataMatrix content into an immutable ParsedDataMatrix."""
+    # GS1 element strings are ASCII-only; reject anything else explicitly
+    # rather than guessing byte offsets for multi-byte characters
+    if not raw_data.isascii():
+        raise ValueError('DataMatrix data contains non-ASCII characters')
+    
+    # Work on one bytes buffer with a forward-only cursor; slices are decoded
+    # to str only when stored in the result
+    buf = raw_data.encode('ascii')
+    
     # Remove any group separators
-    clean_data = raw_data.replace(GROUP_SEPARATOR, '')
+    buf = buf.replace(GROUP_SEPARATOR_BYTE, b'')
+    n = len(buf)
     
     result = {
         'gtin': '',
@@ -47,129 +225,87 @@ def parse_gs1_datamatrix(raw_data: str):
         'ndc': ''
     }
     
-    i = 0
+    # Bind the per-position lookups to locals for the scan loop
+    ai_trie = AI_TRIE
     
-    while i < len(clean_data) - 1:
-        # Must have at least 2 chars for AI
-        if i + 2 > len(clean_data):
-            break
-            
-        ai = clean_data[i:i+2]
-        
-        # Process AIs based on what we've already found
-        # This prevents finding "01" within serial numbers, etc.
-        
-        # GTIN (01) - must be at start
-        if ai == '01' and not result['gtin'] and i + 16 <= len(clean_data):
-            result['gtin'] = clean_data[i+2:i+16]
-            i += 16
-            continue
-            
-        # Serial (21) - variable length
-        elif ai == '21' and result['gtin'] and not result['serial_number']:
-            start = i + 2
-            
-            # For serial numbers, we need to be smarter about finding the end
-            # Serial numbers can contain "17" or "10" as digits, so we can't just
-            # search for these patterns. Instead, we'll look for a pattern where
-            # we definitely have the next AI based on expected data after it.
-            
-            end = len(clean_data)  # default to end
-            
-            # Look through the remaining string
-            j = start
-            while j < len(clean_data) - 1:
-                # Check if we might have hit the expiration date AI
-                if j + 8 <= len(clean_data) and clean_data[j:j+2] == '17':
-                    # For AI 17 to be valid, it must be followed by exactly 6 digits
-                    # AND either be at the end OR followed by another valid AI
-                    potential_exp = clean_data[j+2:j+8]
-                    if potential_exp.isdigit() and len(potential_exp) == 6:
-                        # Check what comes after these 6 digits
-                        after_exp_pos = j + 8
-                        
-                        # If we're at the end, this is likely the expiration AI
-                        if after_exp_pos >= len(clean_data):
-                            end = j
-                            break
-                        
-                        # If followed by AI 10 (lot), this is likely the expiration AI
-                        if after_exp_pos + 2 <= len(clean_data) and clean_data[after_exp_pos:after_exp_pos+2] == '10':
-                            end = j
-                            break
-                            
-                        # If the expiration date forms a valid date, more likely to be the AI
-                        # rather than random digits in serial
-                        try:
-                            yy = int(potential_exp[0:2])
-                            mm = int(potential_exp[2:4])
-                            dd = int(potential_exp[4:6])
-                            # Basic date validation
-                            if 1 <= mm <= 12 and 1 <= dd <= 31:
-                                end = j
-                                break
-                        except:
-                            pass
-                
-                # Check for lot number AI (10) - usually comes after expiration
-                # So finding "10" alone is less reliable than finding "17" + valid date + "10"
-                
-                j += 1
-                    
-            result['serial_number'] = clean_data[start:end]
-            i = end
+    pos = 0
+    
+    # Must have at least 2 bytes for AI
+    while pos < n - 1:
+        d0 = buf[pos] - 0x30
+        d1 = buf[pos+1] - 0x30
+        # Negative iff either byte is outside '0'..'9'
+        if (d0 | d1 | (9 - d0) | (9 - d1)) < 0:
+            pos += 1
             continue
-            
-        # Expiration (17) - fixed 6 digits  
-        elif ai == '17' and result['gtin'] and not result['expiration_date'] and i + 8 <= len(clean_data):
-            exp_date = clean_data[i+2:i+8]
-            if exp_date.isdigit() and len(exp_date) == 6:
-                yy = int(exp_date[0:2])
-                mm = int(exp_date[2:4])
-                dd = int(exp_date[4:6])
-                
-                # Convert YY to YYYY (00-49 -> 2000-2049, 50-99 -> 1950-1999)
-                year = 2000 + yy if yy < 50 else 1900 + yy
-                
-                result['expiration_date'] = f"{year:04d}-{mm:02d}-{dd:02d}"
-            i += 8
+        node = ai_trie[d0][d1]
+        if node is None:
+            # Not a valid AI at this position
+            pos += 1
             continue
-            
-        # Lot (10) - variable length, usually at end
-        elif ai == '10' and result['gtin'] and not result['lot_number']:
-            # Everything after AI is the lot number
-            result['lot_number'] = clean_data[i+2:]
-            break
-            
+        setter, length = node
+        # Fixed-length fields end here; variable-length ones ignore it
+        field_end = pos + 2 + (length or 0)
+        
+        next_pos = setter(result, buf, pos, field_end, n)
+        if next_pos is None:
+            # AI not expected at this position
+            pos += 1
         else:
-            # Not a valid AI at this position
-            i += 1
+            pos = next_pos
     
-    # Extract NDC from GTIN
-    if result['gtin'] and result['gtin'].startswith('003'):
-        # For GTIN starting with 003, extract NDC from positions 4-12 (9 digits)
-        # Expected format: 14395-7010
-        ndc_raw = result['gtin'][3:12]  # 9 digits
-        result['ndc'] = f"{ndc_raw[:5]}-{ndc_raw[5:]}"
-
-    return result
+    return ParsedDataMatrix(**result)
 
 
 def main():
-    """Main entry point for command-line usage."""
+    """
+    Main entry point for command-line usage.
+    
+    By default all of stdin is parsed as one barcode. With --batch, stdin is
+    read as newline-delimited barcodes and one JSON result is written per
+    line, so many scans can be piped through a single process.
+    """
+    if '--batch' in sys.argv[1:]:
+        _main_batch()
+        return
+    
     # Read from stdin instead of command line argument
     # This handles special characters and long data better
     try:
         raw_data = sys.stdin.read().strip()
         
         if not raw_data:
-            print(json.dumps({'error': 'No data provided'}))
+            print(_dumps({'error': 'No data provided'}))
             sys.exit(1)
         
         result = parse_gs1_datamatrix(raw_data)
-        print(json.dumps(result))
+        print(_dumps(result))
     except Exception as e:
-        print(json.dumps({'error': str(e)}))
+        print(_dumps({'error': str(e)}))
+        sys.exit(1)
+
+
+def _main_batch():
+    """Parse each non-empty stdin line as a separate barcode."""
+    found_data = False
+    failed = False
+    for line in sys.stdin:
+        raw_data = line.strip()
+        if not raw_data:
+            continue
+        found_data = True
+        
+        try:
+            result = parse_gs1_datamatrix(raw_data)
+        except Exception as e:
+            result = {'error': str(e)}
+            failed = True
+        print(_dumps(result), flush=True)
+    
+    if not found_data:
+        print(_dumps({'error': 'No data provided'}))
+        sys.exit(1)
+    if failed:
         sys.exit(1)
 
 